@@ -0,0 +1,129 @@
+"""
+Device models attached to mock buses from bench/shims/machine.py.
+
+BME280Model holds register map with calibration data and readings of a real sensor (compensation example from
+Bosch datasheet), SH1106Model decodes commands and keeps display RAM, so driver output can be verified.
+"""
+
+import struct
+
+# Calibration and raw ADC values from Bosch BMP280/BME280 datasheet compensation example
+BME280_CALIBRATION = {
+    'T': (27504, 26435, -1000),
+    'P': (36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000),
+    'H': (75, 362, 0, 313, 50, 30),
+}
+BME280_ADC = {'T': 519888, 'P': 415148, 'H': 30000}
+
+
+class BME280Model:
+    CHIP_ID = 0x60
+
+    def __init__(self, calibration: dict = None, adc: dict = None):
+        calibration = calibration or BME280_CALIBRATION
+        adc = adc or BME280_ADC
+        self.regs = bytearray(256)
+        self.regs[0xD0] = self.CHIP_ID
+
+        struct.pack_into('<Hhh', self.regs, 0x88, *calibration['T'])
+        struct.pack_into('<Hhhhhhhhh', self.regs, 0x8E, *calibration['P'])
+        h1, h2, h3, h4, h5, h6 = calibration['H']
+        self.regs[0xA1] = h1
+        struct.pack_into('<hB', self.regs, 0xE1, h2, h3)
+        # H4 and H5 are 12-bit values sharing 0xE5 register
+        self.regs[0xE4] = (h4 >> 4) & 0xFF
+        self.regs[0xE5] = (h4 & 0x0F) | ((h5 & 0x0F) << 4)
+        self.regs[0xE6] = (h5 >> 4) & 0xFF
+        struct.pack_into('<b', self.regs, 0xE7, h6)
+        self.set_adc(adc['T'], adc['P'], adc['H'])
+
+    def set_adc(self, temperature: int, pressure: int, humidity: int):
+        """Store raw 20-bit temperature and pressure and 16-bit humidity in data registers (0xF7 - 0xFE)."""
+        self.regs[0xF7] = (pressure >> 12) & 0xFF
+        self.regs[0xF8] = (pressure >> 4) & 0xFF
+        self.regs[0xF9] = (pressure << 4) & 0xF0
+        self.regs[0xFA] = (temperature >> 12) & 0xFF
+        self.regs[0xFB] = (temperature >> 4) & 0xFF
+        self.regs[0xFC] = (temperature << 4) & 0xF0
+        struct.pack_into('>H', self.regs, 0xFD, humidity)
+
+    def read_mem(self, register: int, nbytes: int) -> bytes:
+        return bytes(self.regs[register:register + nbytes])
+
+    def write_mem(self, register: int, data: bytes):
+        # Only control and config registers are writable, calibration and data are read only
+        for i, value in enumerate(data):
+            if register + i in (0xE0, 0xF2, 0xF4, 0xF5):
+                self.regs[register + i] = value
+
+
+class SH1106Model:
+    """SH1106 controller with 132x64 RAM. Commands come as I2C writes with control bytes or SPI writes with DC pin."""
+
+    COLUMNS = 132
+    PAGES = 8
+    # Commands followed by one parameter byte
+    TWO_BYTE = (0x81, 0x8D, 0xA8, 0xAD, 0xD3, 0xD5, 0xD9, 0xDA, 0xDB)
+
+    def __init__(self):
+        self.ram = [bytearray(self.COLUMNS) for _ in range(self.PAGES)]
+        self.page = 0
+        self.column = 0
+        self.display_on = False
+        self.commands = 0
+        self.data_bytes = 0
+        self._param_for = None
+
+    def command(self, cmd: int):
+        self.commands += 1
+        if self._param_for is not None:
+            self._param_for = None
+        elif cmd in self.TWO_BYTE:
+            self._param_for = cmd
+        elif 0xB0 <= cmd <= 0xB7:
+            self.page = cmd & 0x07
+        elif cmd <= 0x0F:
+            self.column = (self.column & 0xF0) | cmd
+        elif cmd <= 0x1F:
+            self.column = (self.column & 0x0F) | ((cmd & 0x0F) << 4)
+        elif cmd in (0xAE, 0xAF):
+            self.display_on = cmd == 0xAF
+
+    def data(self, data: bytes):
+        self.data_bytes += len(data)
+        row = self.ram[self.page]
+        for value in data:
+            if self.column < self.COLUMNS:
+                row[self.column] = value
+            self.column += 1
+
+    def write(self, data: bytes):
+        # I2C: control byte with Co (continuation) and D/C# bits, then command or data
+        i = 0
+        while i < len(data):
+            control = data[i]
+            is_data = control & 0x40
+            if control & 0x80:
+                if i + 1 < len(data) and is_data:
+                    self.data(data[i + 1:i + 2])
+                elif i + 1 < len(data):
+                    self.command(data[i + 1])
+                i += 2
+                continue
+            rest = data[i + 1:]
+            if is_data:
+                self.data(rest)
+            else:
+                for cmd in rest:
+                    self.command(cmd)
+            return
+
+    def spi_write(self, data: bytes, dc: int):
+        if dc:
+            self.data(data)
+        else:
+            for cmd in data:
+                self.command(cmd)
+
+    def page_bytes(self, page: int, offset: int = 2, width: int = 128) -> bytes:
+        return bytes(self.ram[page][offset:offset + width])
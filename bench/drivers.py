@@ -0,0 +1,182 @@
+"""
+Benchmark of BME280, SH1106 and Encoder drivers on mock buses.
+
+Drivers run on CPython with machine mocks from bench/shims and device models from bench/devices.py. For each
+operation reports bus transactions, transferred bytes, modelled bus time, time spent in sleeps and host CPU time, e.g.:
+
+    python bench/drivers.py --i2c-freq 400000 --repeat 50
+
+Bus and sleep times follow the configured clocks and are what the device would spend too. Host CPU time only helps
+to compare two versions of a driver, MicroPython on ESP is around 100x slower.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, 'shims'))
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, 'bme280'), os.path.join(ROOT_DIR, 'sh1106')):
+    sys.path.insert(0, path)
+
+import utime  # noqa: E402
+from machine import I2C, SPI, Pin, Timer  # noqa: E402
+from devices import BME280Model, SH1106Model  # noqa: E402
+from bme280 import BME280  # noqa: E402
+from sh1106 import SH1106_I2C, SH1106_SPI  # noqa: E402
+from encoder import Encoder  # noqa: E402
+
+
+def pin_ops(pins: tuple) -> int:
+    return sum(p.reads + p.writes for p in pins)
+
+
+class Result:
+    """Per operation averages of bus, pin and time counters between two snapshots."""
+
+    def __init__(self, name: str, repeat: int, stats, before: tuple, pins: tuple, pins_before: int, cpu_ns: int,
+                 slept_us: int):
+        transactions, nbytes, time_us, inits = [(a - b) / repeat for a, b in zip(stats.snapshot(), before)]
+        self.name = name
+        self.transactions = transactions
+        self.bytes = nbytes
+        self.bus_us = time_us
+        self.inits = inits
+        self.pin_ops = (pin_ops(pins) - pins_before) / repeat
+        self.sleep_us = slept_us / repeat
+        self.cpu_us = cpu_ns / repeat / 1000
+
+
+def measure(name: str, operation, repeat: int, bus, pins: tuple = ()) -> Result:
+    before = bus.stats.snapshot()
+    pins_before = pin_ops(pins)
+    utime.slept_us = 0
+    start = time.perf_counter_ns()
+    for _ in range(repeat):
+        operation()
+    cpu_ns = time.perf_counter_ns() - start
+    return Result(name, repeat, bus.stats, before, pins, pins_before, cpu_ns, utime.slept_us)
+
+
+def bench_bme280(args) -> list:
+    i2c = I2C(0, freq=args.i2c_freq)
+    i2c.attach(0x76, BME280Model())
+    sensor = None
+
+    def init():
+        nonlocal sensor
+        sensor = BME280(i2c=i2c)
+
+    def read_all():
+        return sensor.temperature, sensor.pressure, sensor.humidity
+
+    results = [measure('BME280()', init, 1, i2c)]
+    results.append(measure('read_temperature()', sensor.read_temperature, args.repeat, i2c))
+    results.append(measure('read_pressure()', sensor.read_pressure, args.repeat, i2c))
+    results.append(measure('read_humidity()', sensor.read_humidity, args.repeat, i2c))
+    results.append(measure('read_all (T, P, H)', read_all, args.repeat, i2c))
+    return results
+
+
+def bench_sh1106_i2c(args) -> list:
+    i2c = I2C(0, freq=args.i2c_freq)
+    model = i2c.attach(0x3c, SH1106Model())
+    display = None
+
+    def init():
+        nonlocal display
+        display = SH1106_I2C(128, 64, i2c)
+
+    results = [measure('SH1106_I2C()', init, 1, i2c)]
+    display.pixel(0, 0, 1)
+    results.append(measure('show()', display.show, args.repeat, i2c))
+    results.append(measure('contrast()', lambda: display.contrast(0x80), args.repeat, i2c))
+    verify(display, model)
+    return results
+
+
+def bench_sh1106_spi(args) -> list:
+    spi = SPI(1, baudrate=args.spi_baudrate)
+    dc, res, cs = Pin(22), Pin(23), Pin(4)
+    model = spi.attach(SH1106Model(), dc, cs)
+    pins = (dc, res, cs)
+    display = None
+
+    def init():
+        nonlocal display
+        display = SH1106_SPI(128, 64, spi, dc, res, cs)
+
+    results = [measure('SH1106_SPI()', init, 1, spi, pins)]
+    display.pixel(0, 0, 1)
+    results.append(measure('show()', display.show, args.repeat, spi, pins))
+    results.append(measure('contrast()', lambda: display.contrast(0x80), args.repeat, spi, pins))
+    verify(display, model)
+    return results
+
+
+def bench_encoder(args) -> list:
+    Timer.instances.clear()
+    encoder = Encoder(14, 12, min=0, max=100)
+    timer = Timer.instances[-1]
+    pins = (encoder.clk, encoder.dt)
+    no_bus = I2C(-1)
+    steps = [0]
+
+    def idle():
+        timer.fire()
+
+    def rotate():
+        # One detent: CLK falls while DT is high, then goes back high
+        encoder.dt.drive(1)
+        encoder.clk.drive(steps[0] & 1)
+        steps[0] += 1
+        timer.fire()
+
+    return [
+        measure('update() idle', idle, args.repeat * 10, no_bus, pins),
+        measure('update() rotating', rotate, args.repeat * 10, no_bus, pins),
+    ]
+
+
+def verify(display, model: SH1106Model):
+    for page in range(display.pages):
+        expected = bytes(display.buffer[page * display.width:(page + 1) * display.width])
+        if model.page_bytes(page, 2, display.width) != expected:
+            raise AssertionError('Display RAM differs from frame buffer on page {}'.format(page))
+
+
+def report(title: str, results: list):
+    print(title)
+    print('  {:<22} {:>8} {:>8} {:>10} {:>10} {:>6} {:>6} {:>10}'.format(
+        'operation', 'trans', 'bytes', 'bus us', 'sleep us', 'inits', 'pins', 'cpu us'))
+    for r in results:
+        print('  {:<22} {:>8.1f} {:>8.1f} {:>10.1f} {:>10.0f} {:>6.1f} {:>6.1f} {:>10.1f}'.format(
+            r.name, r.transactions, r.bytes, r.bus_us, r.sleep_us, r.inits, r.pin_ops, r.cpu_us))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--i2c-freq', type=int, default=400000, help='I2C clock in Hz')
+    parser.add_argument('--spi-baudrate', type=int, default=10000000, help='SPI clock in Hz, driver may change it')
+    parser.add_argument('--repeat', type=int, default=20, help='repetitions of each operation')
+    parser.add_argument('--only', choices=('bme280', 'sh1106_i2c', 'sh1106_spi', 'encoder'),
+                        help='run single driver benchmark')
+    args = parser.parse_args()
+
+    utime.real_sleep = False
+    benchmarks = (
+        ('bme280', 'BME280 (I2C {} Hz)'.format(args.i2c_freq), bench_bme280),
+        ('sh1106_i2c', 'SH1106_I2C (I2C {} Hz)'.format(args.i2c_freq), bench_sh1106_i2c),
+        ('sh1106_spi', 'SH1106_SPI', bench_sh1106_spi),
+        ('encoder', 'Encoder (per timer tick)', bench_encoder),
+    )
+    for name, title, bench in benchmarks:
+        if args.only in (None, name):
+            report(title, bench(args))
+
+
+if __name__ == '__main__':
+    main()
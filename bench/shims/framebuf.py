@@ -0,0 +1,77 @@
+"""
+CPython shim for MicroPython framebuf, MONO_VLSB and MONO_HLSB formats only.
+
+Drawing is done pixel by pixel, so it is slow, and text() draws a filled box instead of glyphs, because font is not
+included. Good enough to feed display drivers with data, not for comparing drawing speed.
+"""
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width: int, height: int, format: int, stride: int = None):
+        if format not in (MONO_VLSB, MONO_HLSB):
+            raise ValueError('Unsupported format')
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.format = format
+        self.stride = stride or width
+
+    def _index(self, x: int, y: int) -> tuple:
+        if self.format == MONO_VLSB:
+            return (y >> 3) * self.stride + x, y & 7
+        return (y * self.stride + x) >> 3, 7 - (x & 7)
+
+    def pixel(self, x: int, y: int, c: int = None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        index, bit = self._index(x, y)
+        if c is None:
+            return (self.buffer[index] >> bit) & 1
+        if c:
+            self.buffer[index] |= 1 << bit
+        else:
+            self.buffer[index] &= ~(1 << bit) & 0xff
+
+    def fill(self, c: int):
+        value = 0xff if c else 0x00
+        for i in range(len(self.buffer)):
+            self.buffer[i] = value
+
+    def fill_rect(self, x: int, y: int, w: int, h: int, c: int):
+        for yy in range(max(y, 0), min(y + h, self.height)):
+            for xx in range(max(x, 0), min(x + w, self.width)):
+                self.pixel(xx, yy, c)
+
+    def hline(self, x: int, y: int, w: int, c: int):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x: int, y: int, h: int, c: int):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x: int, y: int, w: int, h: int, c: int):
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def text(self, s: str, x: int, y: int, c: int = 1):
+        self.fill_rect(x, y, 8 * len(s), 8, c)
+
+    def scroll(self, xstep: int, ystep: int):
+        pixels = [[self.pixel(x, y) for x in range(self.width)] for y in range(self.height)]
+        for y in range(self.height):
+            for x in range(self.width):
+                sx, sy = x - xstep, y - ystep
+                if 0 <= sx < self.width and 0 <= sy < self.height:
+                    self.pixel(x, y, pixels[sy][sx])
+
+    def blit(self, fbuf, x: int, y: int, key: int = -1):
+        for yy in range(fbuf.height):
+            for xx in range(fbuf.width):
+                c = fbuf.pixel(xx, yy)
+                if c != key:
+                    self.pixel(x + xx, y + yy, c)
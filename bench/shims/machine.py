@@ -0,0 +1,243 @@
+"""
+CPython mock of MicroPython machine module: Pin, Timer, I2C and SPI.
+
+Buses forward transfers to attached device models (see bench/devices.py) and count transactions, bytes and bus time
+modelled at configured clock. Bus time includes start/stop conditions and address bytes for I2C, but no driver or
+interpreter overhead, which has to be measured on device.
+"""
+
+
+class BusStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.time_us = 0.0
+        self.inits = 0
+
+    def snapshot(self) -> tuple:
+        return self.transactions, self.bytes, self.time_us, self.inits
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode: int = -1, pull: int = -1, value: int = None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 1 if pull == self.PULL_UP else 0
+        self.handler = None
+        self.reads = 0
+        self.writes = 0
+        if value is not None:
+            self._value = value
+
+    def init(self, mode: int = -1, pull: int = -1, value: int = None):
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self._value = value
+
+    def value(self, value=None):
+        if value is None:
+            self.reads += 1
+            return self._value
+        self.writes += 1
+        self._value = 1 if value else 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger: int = IRQ_FALLING | IRQ_RISING):
+        self.handler = handler
+
+    def drive(self, value: int):
+        """Set input level from outside (simulated hardware), without counting it as driver access."""
+        self._value = 1 if value else 0
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    # Drivers often don't keep reference to their timer, benchmark finds them here
+    instances = []
+
+    def __init__(self, id: int = -1, **kwargs):
+        self.id = id
+        self.callback = None
+        self.period = None
+        self.mode = None
+        Timer.instances.append(self)
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode: int = PERIODIC, period: int = -1, callback=None, freq: int = None):
+        self.mode = mode
+        self.period = period if freq is None else 1000 // freq
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+    def fire(self, times: int = 1):
+        """Run timer callback as if the period has elapsed given number of times."""
+        for _ in range(times):
+            if self.callback is None:
+                return
+            self.callback(self)
+            if self.mode == self.ONE_SHOT:
+                self.callback = None
+
+
+class I2C:
+    """I2C bus mock. Devices are attached with attach(address, model).
+
+    Model receives write(data) for plain transfers and read_mem/write_mem for register access. Start/stop primitives
+    (start, write/write_bytes, stop, and begin/end of LoBo port used by SH1106_I2C) are collected and delivered as one
+    write transaction on stop."""
+
+    def __init__(self, id: int = -1, scl=None, sda=None, freq: int = 400000):
+        self.id = id
+        self.freq = freq
+        self.devices = {}
+        self.stats = BusStats()
+        self._raw = None
+
+    def init(self, scl=None, sda=None, freq: int = 400000):
+        self.freq = freq
+        self.stats.inits += 1
+
+    def attach(self, address: int, device):
+        self.devices[address] = device
+        return device
+
+    def scan(self) -> list:
+        return sorted(self.devices)
+
+    def _device(self, address: int):
+        if address not in self.devices:
+            raise OSError(19)  # ENODEV, no ACK from address
+        return self.devices[address]
+
+    def _transfer(self, nbytes: int, restarts: int = 0):
+        # Start, address byte and every data byte with ACK bit (9 clocks each), stop, plus repeated starts
+        bits = 9 * (nbytes + 1 + restarts) + 2 + 2 * restarts
+        self.stats.transactions += 1
+        self.stats.bytes += nbytes
+        self.stats.time_us += bits * 1000000 / self.freq
+
+    def writeto(self, addr: int, buf, stop: bool = True) -> int:
+        self._device(addr).write(bytes(buf))
+        self._transfer(len(buf))
+        return len(buf)
+
+    def readfrom(self, addr: int, nbytes: int, stop: bool = True) -> bytes:
+        data = self._device(addr).read(nbytes)
+        self._transfer(nbytes)
+        return data
+
+    def readfrom_into(self, addr: int, buf, stop: bool = True):
+        buf[:] = self.readfrom(addr, len(buf))
+
+    def writeto_mem(self, addr: int, memaddr: int, buf, addrsize: int = 8):
+        self._device(addr).write_mem(memaddr, bytes(buf))
+        self._transfer(addrsize // 8 + len(buf))
+
+    def readfrom_mem(self, addr: int, memaddr: int, nbytes: int, addrsize: int = 8) -> bytes:
+        data = self._device(addr).read_mem(memaddr, nbytes)
+        self._transfer(addrsize // 8 + nbytes, restarts=1)
+        return data
+
+    def readfrom_mem_into(self, addr: int, memaddr: int, buf, addrsize: int = 8):
+        buf[:] = self.readfrom_mem(addr, memaddr, len(buf), addrsize)
+
+    # Primitive operations
+
+    def begin(self, nbytes: int = 0):
+        self._raw = bytearray()
+
+    def start(self):
+        if self._raw is None:
+            self._raw = bytearray()
+
+    def write(self, buf) -> int:
+        self._raw += bytes(buf)
+        return len(buf)
+
+    write_bytes = write
+
+    def stop(self):
+        raw, self._raw = self._raw, None
+        if not raw:
+            return
+        # First byte is address with R/W bit, data goes to device as plain write
+        self._device(raw[0] >> 1).write(bytes(raw[1:]))
+        self._transfer(len(raw) - 1)
+
+    def end(self):
+        if self._raw:
+            self.stop()
+        self._raw = None
+
+
+class SPI:
+    """SPI bus mock. Device is attached with attach(model, dc, cs) and gets spi_write(data, dc) for every write
+    while its CS pin is low (or when it has no CS pin)."""
+
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id: int = -1, baudrate: int = 1000000, polarity: int = 0, phase: int = 0, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self.stats = BusStats()
+        self.devices = []
+
+    def init(self, baudrate: int = 1000000, polarity: int = 0, phase: int = 0, **kwargs):
+        self.baudrate = baudrate
+        self.stats.inits += 1
+
+    def deinit(self):
+        pass
+
+    def attach(self, device, dc: Pin = None, cs: Pin = None):
+        self.devices.append((device, dc, cs))
+        return device
+
+    def _transfer(self, nbytes: int):
+        self.stats.transactions += 1
+        self.stats.bytes += nbytes
+        self.stats.time_us += nbytes * 8 * 1000000 / self.baudrate
+
+    def write(self, buf):
+        data = bytes(buf)
+        for device, dc, cs in self.devices:
+            if cs is None or not cs._value:
+                device.spi_write(data, dc._value if dc is not None else 0)
+        self._transfer(len(data))
+
+    def read(self, nbytes: int, write: int = 0x00) -> bytes:
+        self._transfer(nbytes)
+        return bytes(nbytes)
+
+    def readinto(self, buf, write: int = 0x00):
+        self._transfer(len(buf))
+
+    def write_readinto(self, write_buf, read_buf):
+        self.write(write_buf)
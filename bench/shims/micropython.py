@@ -0,0 +1,13 @@
+"""CPython shim for MicroPython micropython module."""
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
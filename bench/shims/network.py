@@ -0,0 +1,18 @@
+"""CPython shim for MicroPython network, station interface is always active on localhost."""
+
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    def __init__(self, interface: int = STA_IF):
+        self.interface = interface
+
+    def active(self, *args) -> bool:
+        return self.interface == STA_IF
+
+    def isconnected(self) -> bool:
+        return self.interface == STA_IF
+
+    def ifconfig(self) -> tuple:
+        return '127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1'
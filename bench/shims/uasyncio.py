@@ -0,0 +1,19 @@
+"""CPython shim for MicroPython uasyncio.
+
+When utime.clock is set, sleeps advance it and only yield to other tasks, so scheduling can be tested without waiting.
+Clock is shared, so this is exact only while a single task sleeps at a time."""
+from asyncio import *  # noqa: F401,F403
+from asyncio import sleep as _sleep
+
+import utime
+
+
+def sleep(seconds):
+    if utime.clock is not None:
+        utime.clock.advance(seconds * 1000000)
+        return _sleep(0)
+    return _sleep(seconds)
+
+
+def sleep_ms(ms):
+    return sleep(ms / 1000)
@@ -0,0 +1,2 @@
+"""CPython shim for MicroPython ubinascii."""
+from binascii import *  # noqa: F401,F403
@@ -0,0 +1,2 @@
+"""CPython shim for MicroPython uhashlib."""
+from hashlib import *  # noqa: F401,F403
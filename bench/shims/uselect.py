@@ -0,0 +1,34 @@
+"""CPython shim for MicroPython uselect.
+
+select.poll works with file descriptors, this wrapper returns registered objects from poll() like MicroPython does
+and remembers descriptors, so objects can be unregistered after they have been closed."""
+import select
+
+POLLIN = select.POLLIN
+POLLOUT = select.POLLOUT
+POLLERR = select.POLLERR
+POLLHUP = select.POLLHUP
+
+
+class poll:
+    def __init__(self):
+        self._poll = select.poll()
+        self._objects = {}
+        self._fds = {}
+
+    def register(self, obj, eventmask: int = POLLIN | POLLOUT):
+        fd = obj.fileno()
+        self._poll.register(fd, eventmask)
+        self._objects[fd] = obj
+        self._fds[id(obj)] = fd
+
+    def modify(self, obj, eventmask: int):
+        self._poll.modify(self._fds[id(obj)], eventmask)
+
+    def unregister(self, obj):
+        fd = self._fds.pop(id(obj))
+        del self._objects[fd]
+        self._poll.unregister(fd)
+
+    def poll(self, timeout: int = -1) -> list:
+        return [(self._objects[fd], event) for fd, event in self._poll.poll(timeout) if fd in self._objects]
@@ -0,0 +1,2 @@
+"""CPython shim for MicroPython ustruct."""
+from struct import *  # noqa: F401,F403
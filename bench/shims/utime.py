@@ -0,0 +1,67 @@
+"""CPython shim for MicroPython utime, ticks are taken from monotonic clock.
+
+All sleeps are summed up in slept_us, benchmarks set real_sleep to False to count the waits without waiting. Tests set
+clock to a Clock instance, then ticks follow it and sleeps advance it, so timing doesn't depend on the host load."""
+from time import time, localtime, mktime  # noqa: F401
+from time import sleep as _sleep
+from time import monotonic_ns as _monotonic_ns
+
+_TICKS_PERIOD = 1 << 30
+
+real_sleep = True
+slept_us = 0
+clock = None
+
+
+class Clock:
+    """Time source moved only by advance() and sleeps."""
+
+    def __init__(self, us: int = 0):
+        self.us = us
+
+    def advance(self, us: int):
+        self.us += round(us)
+
+
+def _now_us():
+    return clock.us if clock is not None else _monotonic_ns() // 1000
+
+
+def sleep(seconds):
+    global slept_us
+    slept_us += int(seconds * 1000000)
+    if clock is not None:
+        clock.advance(seconds * 1000000)
+    elif real_sleep:
+        _sleep(seconds)
+
+
+def sleep_ms(ms):
+    sleep(ms / 1000)
+
+
+def sleep_us(us):
+    sleep(us / 1000000)
+
+
+def ticks_ms():
+    return (_now_us() // 1000) % _TICKS_PERIOD
+
+
+def ticks_us():
+    return _now_us() % _TICKS_PERIOD
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) % _TICKS_PERIOD
+    if diff >= _TICKS_PERIOD // 2:
+        diff -= _TICKS_PERIOD
+    return diff
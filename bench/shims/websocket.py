@@ -0,0 +1,95 @@
+"""CPython shim for MicroPython websocket, server side of RFC 6455 framing over a socket.
+
+Like MicroPython, frames are written as text until ioctl(9, 2) switches them to binary. read() is called once poll
+reports data and returns payload of one message, b'' when client closes connection."""
+import struct
+
+_OPCODE_CONT = 0
+_OPCODE_CLOSE = 8
+_OPCODE_PING = 9
+_OPCODE_PONG = 10
+
+_SET_DATA_OPTS = 9
+
+
+class websocket:
+    def __init__(self, sock, blocking: bool = False):
+        self.sock = sock
+        self.opcode = 1
+
+    def ioctl(self, request: int, arg: int = 0) -> int:
+        if request == _SET_DATA_OPTS:
+            prev = self.opcode
+            self.opcode = arg
+            return prev
+        raise OSError(22)
+
+    def _recv_exact(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = self.sock.recv(size)
+            if not chunk:
+                return b''
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _read_frame(self):
+        header = self._recv_exact(2)
+        if not header:
+            return _OPCODE_CLOSE, True, b''
+        fin = header[0] & 0x80
+        opcode = header[0] & 0x0f
+        size = header[1] & 0x7f
+        if size == 126:
+            size = struct.unpack('>H', self._recv_exact(2))[0]
+        elif size == 127:
+            size = struct.unpack('>Q', self._recv_exact(8))[0]
+        mask = self._recv_exact(4) if header[1] & 0x80 else None
+        payload = self._recv_exact(size) if size else b''
+        if mask:
+            payload = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+        return opcode, fin, payload
+
+    def read(self, size: int = -1) -> bytes:
+        # Frame may arrive in several segments, wait for its remaining bytes
+        self.sock.settimeout(5)
+        try:
+            message = b''
+            while True:
+                opcode, fin, payload = self._read_frame()
+                if opcode == _OPCODE_CLOSE:
+                    return b''
+                if opcode == _OPCODE_PING:
+                    self._write_frame(_OPCODE_PONG, payload)
+                    continue
+                if opcode == _OPCODE_PONG:
+                    continue
+                message += payload
+                if fin:
+                    return message
+        finally:
+            self.sock.setblocking(False)
+
+    def _write_frame(self, opcode: int, payload: bytes):
+        size = len(payload)
+        if size < 126:
+            header = struct.pack('>BB', 0x80 | opcode, size)
+        elif size < 65536:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, size)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, size)
+        self.sock.settimeout(5)
+        try:
+            self.sock.sendall(header + bytes(payload))
+        finally:
+            self.sock.setblocking(False)
+
+    def write(self, msg) -> int:
+        if isinstance(msg, str):
+            msg = msg.encode()
+        self._write_frame(self.opcode, msg)
+        return len(msg)
+
+    def close(self):
+        self.sock.close()
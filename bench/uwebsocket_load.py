@@ -0,0 +1,232 @@
+"""
+Load test of uwebsocket.WebSocketServer on CPython.
+
+MicroPython modules are replaced by shims from bench/shims, server runs echo client from uwebsocket README in
+a background thread and the load generator opens WebSocket and HTTP clients against localhost, e.g.:
+
+    python bench/uwebsocket_load.py --ws-clients 8 --http-clients 4 --messages 500
+
+Reported numbers are relative, use them to compare server changes, not to predict ESP timings.
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, 'shims'))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import uwebsocket  # noqa: E402
+from uwebsocket import WebSocketServer, WebSocketClient, ClientClosedError  # noqa: E402
+
+
+class EchoServer(WebSocketServer):
+
+    def _make_client(self, conn):
+        return EchoClient(conn)
+
+
+class EchoClient(WebSocketClient):
+    binary = False
+
+    def process(self):
+        try:
+            msg = self.connection.read()
+            if msg:
+                self.connection.write(msg, self.binary)
+        except ClientClosedError:
+            self.connection.close()
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed by server')
+        data += chunk
+    return data
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connect_latency = []
+        self.ws_latency = []
+        self.http_latency = []
+        self.ws_wire_bytes = 0
+        self.http_connections = 0
+        self.errors = 0
+
+    def add(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                current = getattr(self, name)
+                if isinstance(current, list):
+                    current.extend(value)
+                else:
+                    setattr(self, name, current + value)
+
+
+def ws_client(port: int, messages: int, payload: bytes, binary: bool, stats: Stats, start: threading.Barrier):
+    start.wait()
+    latency = []
+    wire = 0
+    try:
+        begin = time.perf_counter()
+        sock = socket.create_connection(('127.0.0.1', port))
+        key = base64.b64encode(os.urandom(16))
+        sock.sendall(b'GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Key: ' + key + b'\r\nSec-WebSocket-Version: 13\r\n\r\n')
+        response = b''
+        while b'\r\n\r\n' not in response:
+            response += recv_exact(sock, 1)
+        if b' 101 ' not in response.split(b'\r\n')[0]:
+            raise ConnectionError(response.split(b'\r\n')[0].decode())
+        connect = time.perf_counter() - begin
+
+        size = len(payload)
+        header = struct.pack('>BB', 0x82 if binary else 0x81, 0x80 | size) if size < 126 \
+            else struct.pack('>BBH', 0x82 if binary else 0x81, 0x80 | 126, size)
+        mask = os.urandom(4)
+        frame = header + mask + bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+
+        for _ in range(messages):
+            sent = time.perf_counter()
+            sock.sendall(frame)
+            head = recv_exact(sock, 2)
+            length = head[1] & 0x7f
+            ext = 0
+            if length == 126:
+                length = struct.unpack('>H', recv_exact(sock, 2))[0]
+                ext = 2
+            recv_exact(sock, length)
+            latency.append(time.perf_counter() - sent)
+            wire += len(frame) + 2 + ext + length
+
+        sock.sendall(b'\x88\x80' + mask)
+        sock.close()
+        stats.add(connect_latency=[connect], ws_latency=latency, ws_wire_bytes=wire)
+    except (OSError, ConnectionError):
+        stats.add(ws_latency=latency, ws_wire_bytes=wire, errors=1)
+
+
+def http_client(port: int, requests: int, keep_alive: bool, stats: Stats, start: threading.Barrier):
+    start.wait()
+    latency = []
+    connections = 0
+    sock = None
+    request = b'GET /style.css HTTP/1.1\r\nHost: localhost\r\n' + \
+              (b'\r\n' if keep_alive else b'Connection: close\r\n\r\n')
+    try:
+        for _ in range(requests):
+            sent = time.perf_counter()
+            if sock is None:
+                sock = socket.create_connection(('127.0.0.1', port))
+                connections += 1
+            sock.sendall(request)
+            response = b''
+            while b'\r\n\r\n' not in response:
+                response += recv_exact(sock, 1)
+            headers = response.decode().lower()
+            length = int(headers.split('content-length: ')[1].split('\r\n')[0])
+            recv_exact(sock, length)
+            latency.append(time.perf_counter() - sent)
+            if 'connection: close' in headers:
+                sock.close()
+                sock = None
+        stats.add(http_latency=latency, http_connections=connections)
+    except (OSError, ConnectionError):
+        stats.add(http_latency=latency, http_connections=connections, errors=1)
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+def run_server(server: WebSocketServer):
+    asyncio.run(server.process_all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ws-clients', type=int, default=4)
+    parser.add_argument('--http-clients', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=200, help='messages sent by each WebSocket client')
+    parser.add_argument('--requests', type=int, default=50, help='requests sent by each HTTP client')
+    parser.add_argument('--payload', type=int, default=32, help='WebSocket message size in bytes')
+    parser.add_argument('--binary', action='store_true', help='send binary instead of text frames')
+    parser.add_argument('--no-keep-alive', action='store_true', help='HTTP clients close connection after request')
+    parser.add_argument('--verbose', action='store_true', help='show server output')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        uwebsocket.print = lambda *a, **kw: None
+
+    www = tempfile.mkdtemp()
+    with open(os.path.join(www, 'index.html'), 'w') as f:
+        f.write('<html><head><link rel="stylesheet" href="style.css"></head><body></body></html>')
+    with open(os.path.join(www, 'style.css'), 'w') as f:
+        f.write('body { background: #fff; }\n' * 40)
+
+    server = EchoServer(max_connections=args.ws_clients, max_http_connections=args.ws_clients + args.http_clients)
+    server._web_dir = www
+    server.start(args.port)
+    EchoClient.binary = args.binary
+    threading.Thread(target=run_server, args=(server,), daemon=True).start()
+
+    stats = Stats()
+    start = threading.Barrier(args.ws_clients + args.http_clients + 1)
+    payload = bytes(i & 0x7f or 0x20 for i in range(args.payload))
+    threads = [threading.Thread(target=ws_client, args=(args.port, args.messages, payload, args.binary, stats, start))
+               for _ in range(args.ws_clients)]
+    threads += [threading.Thread(target=http_client, args=(args.port, args.requests, not args.no_keep_alive,
+                                                           stats, start))
+                for _ in range(args.http_clients)]
+    for t in threads:
+        t.start()
+    start.wait()
+    began = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    metrics = server.metrics
+
+    ms = 1000
+    ws_count = len(stats.ws_latency)
+    http_count = len(stats.http_latency)
+    print('duration              {:.2f} s'.format(elapsed))
+    print('accepted              {} connections, {:.1f}/s'.format(metrics.accepted, metrics.accepted / elapsed))
+    print('ws handshake          p50 {:.2f} ms, p99 {:.2f} ms'.format(
+        percentile(stats.connect_latency, 50) * ms, percentile(stats.connect_latency, 99) * ms))
+    print('ws messages           {}, {:.1f} msg/s'.format(ws_count, ws_count / elapsed))
+    print('ws round trip         p50 {:.2f} ms, p99 {:.2f} ms'.format(
+        percentile(stats.ws_latency, 50) * ms, percentile(stats.ws_latency, 99) * ms))
+    print('ws bytes per message  {:.1f} on wire (payload {})'.format(
+        stats.ws_wire_bytes / ws_count if ws_count else 0, args.payload))
+    print('http requests         {} over {} connections, {:.1f} req/s'.format(
+        http_count, stats.http_connections, http_count / elapsed))
+    print('http latency          p50 {:.2f} ms, p99 {:.2f} ms'.format(
+        percentile(stats.http_latency, 50) * ms, percentile(stats.http_latency, 99) * ms))
+    print('server loop           {} iterations, mean {:.0f} us, max {} us'.format(
+        metrics.loop.count, metrics.loop.sum / metrics.loop.count if metrics.loop.count else 0, metrics.loop.max))
+    print('client errors         {}'.format(stats.errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import uasyncio as asyncio
+import ustruct
+from utime import ticks_ms, ticks_us, ticks_diff, ticks_add
+
+
+class SampleBuffer:
+    """Ring of preallocated fixed size records shared between producer and consumer tasks.
+
+    Producer packs values straight into the next slot, consumers get memoryviews of stored records, so samples pass
+    from sensor to display and network without allocating. Records are addressed by sequence number, consumer keeps
+    the last one it has seen and reads newer records with since(). Record layout is ustruct format string or an object
+    with size and pack_into(buf, offset, *values), e.g. uwebsocket.Schema."""
+
+    def __init__(self, layout, slots: int = 8):
+        self.layout = layout
+        self.size = ustruct.calcsize(layout) if isinstance(layout, str) else layout.size
+        self.slots = slots
+        self.seq = 0  # sequence number of the next record
+        self._buf = bytearray(self.size * slots)
+        self._mv = memoryview(self._buf)
+
+    def put(self, *values):
+        offset = (self.seq % self.slots) * self.size
+        if isinstance(self.layout, str):
+            ustruct.pack_into(self.layout, self._buf, offset, *values)
+        else:
+            self.layout.pack_into(self._buf, offset, *values)
+        self.seq += 1
+
+    def get(self, seq: int):
+        """Returns memoryview of record with given sequence number, None if it was overwritten or not written yet."""
+        if seq < 0 or seq >= self.seq or seq < self.seq - self.slots:
+            return None
+        offset = (seq % self.slots) * self.size
+        return self._mv[offset:offset + self.size]
+
+    def latest(self):
+        return self.get(self.seq - 1)
+
+    def since(self, seq: int):
+        """Yields records newer than given sequence number, oldest first. Records lost by overwriting are skipped."""
+        for i in range(max(seq + 1, self.seq - self.slots), self.seq):
+            yield self.get(i)
+
+    def unpack(self, record) -> tuple:
+        if isinstance(self.layout, str):
+            return ustruct.unpack(self.layout, record)
+        values = ustruct.unpack(self.layout.format, record)
+        # Message id of Schema is part of the record, not of the values
+        if getattr(self.layout, 'msg_id', None) is not None:
+            values = values[1:]
+        return values
+
+
+class Task:
+    """Periodic job of Scheduler.
+
+    Job is released every period_ms on a fixed grid (no drift) and should finish within deadline_ms from release.
+    Function may be plain or async. Higher priority runs first when several tasks are released at the same time."""
+
+    def __init__(self, name: str, func, period_ms: int, deadline_ms: int = None, priority: int = 0):
+        self.name = name
+        self.func = func
+        self.period = period_ms
+        self.deadline = deadline_ms if deadline_ms is not None else period_ms
+        self.priority = priority
+        self.release = 0
+        self.runs = 0
+        self.overruns = 0  # finished after deadline
+        self.skipped = 0  # releases missed completely
+        self.deferred = 0  # releases which had to wait for higher priority task
+        self.errors = 0  # runs which raised an exception
+        self.wcet_us = 0  # longest observed execution time
+        self.last_us = 0
+        self.max_late_ms = 0
+        self._deferred_release = None
+
+    def stats(self) -> str:
+        return '{}: runs {}, overruns {}, skipped {}, deferred {}, errors {}, last {} us, max {} us, ' \
+               'max late {} ms'.format(self.name, self.runs, self.overruns, self.skipped, self.deferred, self.errors,
+                                       self.last_us, self.wcet_us, self.max_late_ms)
+
+
+class Scheduler:
+    """Cooperative scheduler of periodic tasks, runs as single uasyncio task.
+
+    Released tasks run in priority order. Lower priority task is started only if its longest observed execution time
+    fits before any higher priority task needs the CPU: next release of the ones waiting for it, or the forced start
+    of the ones already released but waiting for their own gap. Otherwise it waits, so slow display flush or network
+    handling can't delay sampling. Task longer than any gap left by higher priority tasks is started at the beginning
+    of the largest gap, where it delays them the least. Task waiting longer than its own deadline is started anyway.
+    Exceptions raised by a task are counted and passed to on_error, other tasks keep running. Between tasks scheduler
+    yields to other uasyncio tasks."""
+
+    def __init__(self):
+        self.tasks = []
+        self._running = False
+
+    def add(self, name: str, func, period_ms: int, deadline_ms: int = None, priority: int = 0) -> Task:
+        task = Task(name, func, period_ms, deadline_ms, priority)
+        self.tasks.append(task)
+        # Keep tasks ordered by priority, so picking the next one is a single pass
+        self.tasks.sort(key=lambda t: -t.priority)
+        if self._running:
+            task.release = ticks_ms()
+        return task
+
+    def on_overrun(self, task: Task, late_ms: int):
+        # Called when task finished late_ms after its deadline, override to log or react
+        pass
+
+    def on_error(self, task: Task, exc: Exception):
+        # Called when task raised an exception, override to log or react
+        print("Task {} failed: {!r}".format(task.name, exc))
+
+    def _gap(self, task: Task, now: int):
+        # Microseconds until first higher priority task needs the CPU, None if there is no higher priority task
+        gap = None
+        for other in self.tasks:
+            if other.priority <= task.priority:
+                break
+            until = ticks_diff(other.release, now)
+            if until <= 0:
+                # Released, but waiting for its own gap. It has to start at its deadline at the latest
+                until += other.deadline
+            if gap is None or until < gap:
+                gap = until
+        return gap * 1000 if gap is not None else None
+
+    def _room(self, task: Task) -> int:
+        # Longest gap higher priority tasks leave between their runs, in microseconds
+        room = None
+        for other in self.tasks:
+            if other.priority <= task.priority:
+                break
+            free = other.period * 1000 - other.wcet_us
+            if room is None or free < room:
+                room = free
+        return room
+
+    def _can_start(self, task: Task, now: int) -> bool:
+        gap = self._gap(task, now)
+        if gap is None or gap >= task.wcet_us:
+            return True
+        # Task never fits between higher priority tasks, start it close to the beginning of the largest gap
+        room = self._room(task)
+        return task.wcet_us > room and gap * 4 >= room * 3
+
+    def _pick(self, now: int):
+        for task in self.tasks:
+            waiting = ticks_diff(now, task.release)
+            if waiting < 0:
+                continue
+            if waiting >= task.deadline or self._can_start(task, now):
+                return task
+            if task._deferred_release != task.release:
+                task._deferred_release = task.release
+                task.deferred += 1
+        return None
+
+    async def _run(self, task: Task, now: int):
+        late = ticks_diff(now, task.release)
+        if late > task.max_late_ms:
+            task.max_late_ms = late
+
+        start = ticks_us()
+        try:
+            result = task.func()
+            if result is not None and hasattr(result, 'send'):
+                await result
+        except Exception as e:
+            task.errors += 1
+            self.on_error(task, e)
+        task.last_us = ticks_diff(ticks_us(), start)
+        if task.last_us > task.wcet_us:
+            task.wcet_us = task.last_us
+        task.runs += 1
+
+        finished = ticks_ms()
+        over = ticks_diff(finished, task.release) - task.deadline
+        if over > 0:
+            task.overruns += 1
+            self.on_overrun(task, over)
+
+        # Next release on fixed grid, periods which already passed are skipped
+        task.release = ticks_add(task.release, task.period)
+        while ticks_diff(finished, task.release) >= task.period:
+            task.release = ticks_add(task.release, task.period)
+            task.skipped += 1
+
+    def _sleep_time(self, now: int) -> int:
+        # Sleep until next release, or until deferred task reaches its deadline and has to run anyway
+        wait = None
+        for task in self.tasks:
+            until = ticks_diff(task.release, now)
+            if until <= 0:
+                until += task.deadline
+            if wait is None or until < wait:
+                wait = until
+        return max(0, wait) if wait is not None else 10
+
+    async def run(self):
+        self._running = True
+        now = ticks_ms()
+        for task in self.tasks:
+            task.release = now
+
+        while self._running:
+            now = ticks_ms()
+            task = self._pick(now)
+            if task is None:
+                await asyncio.sleep_ms(self._sleep_time(now))
+            else:
+                await self._run(task, now)
+                await asyncio.sleep_ms(0)
+
+    def stop(self):
+        self._running = False
+
+    def report(self) -> str:
+        return '\n'.join(task.stats() for task in self.tasks)
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bench', 'shims'))
+sys.path.insert(0, ROOT_DIR)
+
+import utime  # noqa: E402
+from scheduler import Scheduler, SampleBuffer  # noqa: E402
+from uwebsocket import Schema  # noqa: E402
+
+
+def busy(ms: float):
+    # Blocks like a driver call on device, without giving control back to event loop
+    utime.clock.advance(ms * 1000)
+
+
+def run_for(scheduler: Scheduler, ms: int):
+    # Scheduler sleeps advance the clock, so the loop only yields until scheduler gets there
+    end = utime.clock.us + ms * 1000
+
+    async def main():
+        task = asyncio.ensure_future(scheduler.run())
+        while utime.clock.us < end:
+            await asyncio.sleep(0)
+        scheduler.stop()
+        await task
+
+    asyncio.run(main())
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        utime.clock = utime.Clock()
+
+    def tearDown(self):
+        utime.clock = None
+
+    def test_lower_tasks_use_remaining_time(self):
+        # Display never fits between sample releases, it must not starve network task or miss its own deadline
+        s = Scheduler()
+        sample = s.add('sample', lambda: None, 20, priority=10)
+        display = s.add('display', lambda: busy(30), 200, priority=5)
+        net = s.add('net', lambda: busy(3.5), 50, priority=1)
+        run_for(s, 2000)
+
+        self.assertEqual((sample.runs, display.runs, net.runs), (100, 10, 40))
+        self.assertEqual((sample.overruns, display.overruns, net.overruns), (0, 0, 0))
+        self.assertEqual((sample.skipped, display.skipped, net.skipped), (0, 0, 0))
+
+    def test_exception_doesnt_stop_scheduler(self):
+        class QuietScheduler(Scheduler):
+            def on_error(self, task, exc):
+                self.failed = task
+
+        def fail():
+            raise OSError(5)
+
+        s = QuietScheduler()
+        sample = s.add('sample', lambda: None, 10, priority=10)
+        broken = s.add('broken', fail, 20, priority=1)
+        run_for(s, 200)
+
+        self.assertIs(s.failed, broken)
+        self.assertEqual((broken.runs, broken.errors), (10, 10))
+        self.assertEqual((sample.runs, sample.errors), (20, 0))
+
+
+class SampleBufferTest(unittest.TestCase):
+
+    def test_schema_unpack_strips_msg_id(self):
+        buf = SampleBuffer(Schema((('ticks', 'I'), ('value', 'h'))), 2)
+        with_id = SampleBuffer(Schema((('ticks', 'I'), ('value', 'h')), msg_id=1), 2)
+        buf.put(3, 5)
+        with_id.put(3, 5)
+        self.assertEqual(buf.unpack(buf.latest()), (3, 5))
+        self.assertEqual(with_id.unpack(with_id.latest()), (3, 5))
+
+    def test_since_skips_overwritten(self):
+        buf = SampleBuffer('<H', 3)
+        for i in range(5):
+            buf.put(i)
+        self.assertEqual([buf.unpack(r)[0] for r in buf.since(0)], [2, 3, 4])
+        self.assertIsNone(buf.get(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import os
+import socket
+import struct
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bench', 'shims'))
+sys.path.insert(0, ROOT_DIR)
+
+import uselect  # noqa: E402
+import utime  # noqa: E402
+import uwebsocket  # noqa: E402
+from uwebsocket import Schema, CoalescingWriter, HttpRequest, WebSocketServer  # noqa: E402
+
+
+class FrameRecorder:
+    # Stands in for WebSocketConnection, keeps copies of written frames
+    def __init__(self):
+        self.frames = []
+
+    def write(self, msg, binary: bool = False):
+        self.frames.append((bytes(msg), binary))
+
+
+class HttpRequestTest(unittest.TestCase):
+
+    def test_request_line_and_headers(self):
+        request = HttpRequest()
+        self.assertTrue(request.feed(b'GET /a/b.css?v=1 HTTP/1.1\r\nHost: x\r\nSec-WebSocket-Key: abc== \r\n\r\n'))
+        self.assertEqual((request.method, request.path, request.http11), ('GET', '/a/b.css', True))
+        self.assertEqual(request.ws_key, b'abc==')
+        self.assertFalse(request.upgrade)
+        self.assertTrue(request.keep_alive)
+
+    def test_byte_by_byte(self):
+        request = HttpRequest()
+        data = b'\r\nGET / HTTP/1.1\nUpgrade: websocket\r\n\r\n'
+        for i in range(len(data) - 1):
+            self.assertFalse(request.feed(data[i:i + 1]))
+        self.assertTrue(request.feed(data[-1:]))
+        self.assertEqual(request.path, '/')
+        self.assertTrue(request.upgrade)
+
+    def test_pipelined_requests(self):
+        request = HttpRequest()
+        self.assertTrue(request.feed(b'GET /a HTTP/1.1\r\n\r\nGET /b HTTP/1.1\r\n\r\nGET /c HT'))
+        self.assertEqual(request.path, '/a')
+        self.assertTrue(request.next())
+        self.assertEqual(request.path, '/b')
+        self.assertFalse(request.next())
+        self.assertEqual(request.buffered, 9)
+        self.assertTrue(request.feed(b'TP/1.1\r\n\r\n'))
+        self.assertEqual(request.path, '/c')
+        self.assertFalse(request.next())
+        self.assertEqual(request.buffered, 0)
+
+    def test_read_into_space(self):
+        request = HttpRequest(64)
+        data = b'GET /x HTTP/1.1\r\n\r\n'
+        request.space()[:len(data)] = data
+        self.assertTrue(request.received(len(data)))
+        self.assertEqual(request.path, '/x')
+
+    def test_headers_too_large(self):
+        request = HttpRequest()
+        self.assertFalse(request.feed(b'GET / HTTP/1.1\r\nX-Pad: ' + b'a' * 900))
+        with self.assertRaises(ValueError):
+            request.feed(b'a' * 200)
+        # Filling the buffer exactly without end of headers fails too, no more bytes could come
+        request = HttpRequest(32)
+        with self.assertRaises(ValueError):
+            request.feed(b'GET / HTTP/1.1\r\nX-Pad: ' + b'a' * 9)
+
+    def test_malformed_lines(self):
+        with self.assertRaises(ValueError):
+            HttpRequest().feed(b'GET /\r\n\r\n')
+        with self.assertRaises(ValueError):
+            HttpRequest().feed(b'GET / HTTP/1.1\r\nno colon here\r\n\r\n')
+
+    def test_case_insensitive_tokens(self):
+        request = HttpRequest()
+        request.feed(b'GET / HTTP/1.1\r\nUPGRADE: WebSocket\r\nconnection: keep-alive, Upgrade\r\n\r\n')
+        self.assertTrue(request.upgrade)
+        self.assertTrue(request.conn_keep_alive)
+        request = HttpRequest()
+        request.feed(b'GET / HTTP/1.1\r\nConnection: Close\r\n\r\n')
+        self.assertFalse(request.keep_alive)
+
+    def test_http10_keep_alive(self):
+        request = HttpRequest()
+        request.feed(b'GET / HTTP/1.0\r\n\r\n')
+        self.assertFalse(request.keep_alive)
+        request = HttpRequest()
+        request.feed(b'GET / HTTP/1.0\r\nConnection: Keep-Alive\r\n\r\n')
+        self.assertTrue(request.keep_alive)
+
+
+class Listener:
+    # Stands in for listening socket, accept() returns server end of a socket pair
+    def __init__(self, sock):
+        self.sock = sock
+
+    def accept(self):
+        return self.sock, ('127.0.0.1', 1)
+
+
+class KeepAliveTest(unittest.TestCase):
+
+    def setUp(self):
+        uwebsocket.print = lambda *args: None
+        self.www = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.www.name, 'a.txt'), 'w') as f:
+            f.write('hello')
+        self.server = WebSocketServer()
+        self.server._web_dir = self.www.name
+        self.server._http_poll = uselect.poll()
+        server_end, self.client = socket.socketpair()
+        self.client.settimeout(1)
+        self.server._listen_s = Listener(server_end)
+        self.server._accept_conn()
+
+    def tearDown(self):
+        self.server._listen_s = None
+        self.server.stop()
+        self.client.close()
+        self.www.cleanup()
+        del uwebsocket.print
+
+    def request(self, data: bytes) -> bytes:
+        self.client.sendall(data)
+        self.server._check_http_connections()
+        response = b''
+        while True:
+            try:
+                chunk = self.client.recv(4096)
+            except socket.timeout:
+                break
+            if not chunk:
+                break
+            response += chunk
+            if response.endswith(b'hello') or response.endswith(b'</html>'):
+                break
+        return response
+
+    def test_pipelined_requests_on_kept_alive_connection(self):
+        response = self.request(b'GET /a.txt HTTP/1.1\r\n\r\nGET /missing HTTP/1.1\r\n\r\n')
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'Connection: keep-alive\r\n\r\nhelloHTTP/1.1 404 Not Found\r\n', response)
+        self.assertEqual(len(self.server._http_conns), 1)
+        self.assertEqual(self.server.metrics.http_requests, 2)
+
+    def test_close_after_http10_request(self):
+        response = self.request(b'GET /a.txt HTTP/1.0\r\n\r\n')
+        self.assertIn(b'Connection: close\r\n\r\nhello', response)
+        self.assertEqual(self.server._http_conns, [])
+
+    def test_metrics_streamed_with_exact_length(self):
+        self.client.sendall(b'GET /metrics HTTP/1.1\r\n\r\nGET /a.txt HTTP/1.1\r\n\r\n')
+        self.server._check_http_connections()
+        response = b''
+        while not response.endswith(b'hello'):
+            response += self.client.recv(4096)
+        headers, rest = response.split(b'\r\n\r\n', 1)
+        length = int(headers.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+        body, next_response = rest[:length], rest[length:]
+        self.assertGreater(length, len(self.server._file_buf))
+        self.assertTrue(body.endswith(b'\n'))
+        self.assertIn(b'\nuws_http_requests_total 1\n', body)
+        self.assertIn(b'\nuws_responses_total{code="200"} 1\n', body)
+        self.assertTrue(next_response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertEqual(self.server.metrics.bytes_out, len(response))
+
+    def test_oversized_request_rejected(self):
+        response = self.request(b'GET /a.txt HTTP/1.1\r\nX-Pad: ' + b'a' * 1100 + b'\r\n\r\n')
+        self.assertTrue(response.startswith(b'HTTP/1.1 400 Bad Request\r\n'))
+        self.assertEqual(self.server._http_conns, [])
+
+
+class SchemaTest(unittest.TestCase):
+
+    def test_pack_unpack(self):
+        schema = Schema((('ticks', 'I'), ('value', 'h')), msg_id=7)
+        self.assertEqual(schema.size, 7)
+        data = schema.pack(1000, -2)
+        self.assertEqual(data, b'\x07\xe8\x03\x00\x00\xfe\xff')
+        self.assertEqual(schema.unpack(data), {'ticks': 1000, 'value': -2})
+
+    def test_pack_into_offset(self):
+        schema = Schema((('value', 'H'),))
+        buf = bytearray(4)
+        schema.pack_into(buf, 2, 0x0102)
+        self.assertEqual(buf, b'\x00\x00\x02\x01')
+        self.assertEqual(schema.unpack(buf, 2), {'value': 0x0102})
+
+
+class CoalescingWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        utime.clock = utime.Clock()
+        self.conn = FrameRecorder()
+        self.schema = Schema((('value', 'h'),))
+
+    def tearDown(self):
+        utime.clock = None
+
+    def test_frame_on_size_limit(self):
+        writer = CoalescingWriter(self.conn, max_size=4, window_ms=100)
+        for value in (1, 2, 3):
+            writer.pack(self.schema, value)
+        self.assertEqual(self.conn.frames, [(b'\x01\x00\x02\x00', True)])
+        writer.write(b'\x04\x00')
+        writer.flush()
+        self.assertEqual(self.conn.frames[1], (b'\x03\x00\x04\x00', True))
+
+    def test_frame_on_window_expiry(self):
+        writer = CoalescingWriter(self.conn, max_size=64, window_ms=100)
+        writer.pack(self.schema, 1)
+        utime.clock.advance(60000)
+        writer.pack(self.schema, 2)
+        utime.clock.advance(39000)
+        writer.process()
+        self.assertEqual(self.conn.frames, [])
+        # Window counts from the oldest pending message, not the latest one
+        utime.clock.advance(1000)
+        writer.process()
+        self.assertEqual(self.conn.frames, [(b'\x01\x00\x02\x00', True)])
+        writer.process()
+        self.assertEqual(len(self.conn.frames), 1)
+
+    def test_failed_pack_leaves_batch_unchanged(self):
+        writer = CoalescingWriter(self.conn, max_size=64, window_ms=100)
+        writer.pack(self.schema, 1)
+        with self.assertRaises(struct.error):
+            writer.pack(self.schema, 40000)
+        with self.assertRaises(struct.error):
+            writer.pack(self.schema, 1, 2)
+        writer.pack(self.schema, 2)
+        writer.flush()
+        self.assertEqual(self.conn.frames, [(b'\x01\x00\x02\x00', True)])
+
+    def test_failed_first_pack_doesnt_start_window(self):
+        writer = CoalescingWriter(self.conn, max_size=64, window_ms=100)
+        with self.assertRaises(struct.error):
+            writer.pack(self.schema, 40000)
+        utime.clock.advance(150000)
+        writer.pack(self.schema, 1)
+        writer.process()
+        self.assertEqual(self.conn.frames, [])
+
+    def test_message_larger_than_buffer(self):
+        writer = CoalescingWriter(self.conn, max_size=4)
+        with self.assertRaises(ValueError):
+            writer.write(b'12345')
+
+
+if __name__ == '__main__':
+    unittest.main()
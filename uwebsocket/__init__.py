@@ -1,27 +1,41 @@
 import os
 import socket
 import network
-from time import sleep
+from utime import sleep, ticks_ms, ticks_us, ticks_diff
 import uselect
 import uasyncio as asyncio
-import websocket_helper
+import uhashlib
+import ubinascii
+import ustruct
 from websocket import websocket
 
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Data opts for websocket.ioctl, select opcode of written frames
+WS_SET_DATA_OPTS = 9
+WS_FRAME_TEXT = 1
+WS_FRAME_BINARY = 2
+
+# errno of non-blocking socket without data
+EAGAIN = 11
+
 
 class ClientClosedError(Exception):
     pass
 
 
 class WebSocketConnection:
-    def __init__(self, addr: str, s: socket, close_callback):
+    def __init__(self, addr: str, s: socket, close_callback, metrics=None):
         self.client_close = False
         self._need_check = False
+        self._binary = False
 
         self.address = addr
         self.socket = s
         self.ws = websocket(s, True)
         self.poll = uselect.poll()
         self.close_callback = close_callback
+        self.metrics = metrics
 
         self.socket.setblocking(False)
         self.poll.register(self.socket, uselect.POLLIN)
@@ -47,11 +61,20 @@ class WebSocketConnection:
         if not msg_bytes or self.client_close:
             raise ClientClosedError()
 
+        if self.metrics:
+            self.metrics.ws_messages_in += 1
+            self.metrics.ws_bytes_in += len(msg_bytes)
         return msg_bytes
 
-    def write(self, msg):
+    def write(self, msg, binary: bool = False):
         try:
+            if binary != self._binary:
+                self.ws.ioctl(WS_SET_DATA_OPTS, WS_FRAME_BINARY if binary else WS_FRAME_TEXT)
+                self._binary = binary
             self.ws.write(msg)
+            if self.metrics:
+                self.metrics.ws_messages_out += 1
+                self.metrics.ws_bytes_out += len(msg)
         except OSError:
             self.client_close = True
 
@@ -76,14 +99,338 @@ class WebSocketClient:
         pass
 
 
+class Schema:
+    """Binary message layout described by (name, ustruct format) fields.
+
+    Records are packed little endian without padding, optionally prefixed with one byte message id, so client can
+    tell record types apart when different schemas are sent through the same connection."""
+
+    def __init__(self, fields, msg_id: int = None):
+        self.names = tuple(name for name, _ in fields)
+        self.msg_id = msg_id
+        self.format = '<' + ('B' if msg_id is not None else '') + ''.join(fmt for _, fmt in fields)
+        self.size = ustruct.calcsize(self.format)
+
+    def pack(self, *values) -> bytes:
+        if self.msg_id is not None:
+            return ustruct.pack(self.format, self.msg_id, *values)
+        return ustruct.pack(self.format, *values)
+
+    def pack_into(self, buf, offset: int, *values):
+        if self.msg_id is not None:
+            ustruct.pack_into(self.format, buf, offset, self.msg_id, *values)
+        else:
+            ustruct.pack_into(self.format, buf, offset, *values)
+
+    def unpack(self, buf, offset: int = 0) -> dict:
+        values = ustruct.unpack_from(self.format, buf, offset)
+        if self.msg_id is not None:
+            values = values[1:]
+        return dict(zip(self.names, values))
+
+
+class CoalescingWriter:
+    """Batches binary messages written within a time window into a single WebSocket frame.
+
+    Messages are appended to a preallocated buffer and sent as one frame when buffer can't take next message or
+    when the oldest pending message is older than window_ms. Messages are concatenated as they are, so they have to
+    be self-delimiting (e.g. fixed size records packed with Schema). Call process() regularly to flush on time."""
+
+    def __init__(self, conn: WebSocketConnection, max_size: int = 512, window_ms: int = 100):
+        self.connection = conn
+        self.window_ms = window_ms
+        self._buf = bytearray(max_size)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self._first = 0
+
+    def _offset(self, size: int) -> int:
+        # Where the next message goes, pending batch is flushed first if the message doesn't fit after it
+        if size > len(self._buf):
+            raise ValueError('Message larger than coalescing buffer')
+        if self._len + size > len(self._buf):
+            self.flush()
+        return self._len
+
+    def _commit(self, size: int):
+        # Message is added to the batch only once it was written completely
+        if not self._len:
+            self._first = ticks_ms()
+        self._len += size
+
+    def write(self, msg):
+        size = len(msg)
+        offset = self._offset(size)
+        self._mv[offset:offset + size] = msg
+        self._commit(size)
+
+    def pack(self, schema: Schema, *values):
+        """Pack values directly into the batch buffer, without creating intermediate bytes."""
+        schema.pack_into(self._buf, self._offset(schema.size), *values)
+        self._commit(schema.size)
+
+    def process(self):
+        if self._len and ticks_diff(ticks_ms(), self._first) >= self.window_ms:
+            self.flush()
+
+    def flush(self):
+        if not self._len:
+            return
+        self.connection.write(self._mv[:self._len], True)
+        self._len = 0
+
+
+class HttpRequest:
+    """Incremental HTTP/1.x request header parser.
+
+    Bytes are read from the socket straight into a fixed size buffer (space() and received()) or fed as copies,
+    lines are parsed in place.
+    Only the request line and the headers needed by the server (Upgrade, Connection, Sec-WebSocket-Key) are decoded,
+    all other headers are skipped without allocating strings."""
+
+    def __init__(self, size: int = 1024):
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self._reset()
+
+    def _reset(self):
+        self._line = 0  # start of the line being parsed
+        self._scan = 0  # next byte to check for end of line
+        self.method = None
+        self.path = None
+        self.http11 = False
+        self.upgrade = False
+        self.ws_key = None
+        self.conn_close = False
+        self.conn_keep_alive = False
+        self.complete = False
+
+    @property
+    def keep_alive(self) -> bool:
+        if self.conn_close:
+            return False
+        return self.http11 or self.conn_keep_alive
+
+    @property
+    def buffered(self) -> int:
+        """Number of received bytes of the current request, 0 if it hasn't started yet."""
+        return self._len
+
+    def feed(self, data) -> bool:
+        """Append received bytes and parse them. Returns True when all headers of the request have been received."""
+        size = len(data)
+        if self._len + size > len(self._buf):
+            raise ValueError('Request headers too large')
+        self._mv[self._len:self._len + size] = data
+        self._len += size
+        return self._parse()
+
+    def space(self) -> memoryview:
+        """Free part of the buffer, socket can read into it directly. Call received() with number of bytes read."""
+        return self._mv[self._len:]
+
+    def received(self, size: int) -> bool:
+        """Parse bytes read into space(). Returns True when all headers of the request have been received."""
+        self._len += size
+        return self._parse()
+
+    def next(self) -> bool:
+        """Drop already handled request, keep bytes which belong to the next (pipelined) one and parse them."""
+        rest = self._len - self._line
+        if rest:
+            self._mv[:rest] = self._mv[self._line:self._len]
+        self._len = rest
+        self._reset()
+        return self._parse()
+
+    def _parse(self) -> bool:
+        if self.complete:
+            return True
+        buf = self._buf
+        i = self._scan
+        while i < self._len:
+            if buf[i] == 10:  # LF, CR before it is optional
+                end = i - 1 if i > self._line and buf[i - 1] == 13 else i
+                start = self._line
+                self._line = i + 1
+                if not self._parse_line(start, end):
+                    self._scan = self._line
+                    self.complete = True
+                    return True
+            i += 1
+        self._scan = i
+        if self._len == len(self._buf):
+            # Buffer is full and headers haven't ended, they can't fit
+            raise ValueError('Request headers too large')
+        return False
+
+    def _parse_line(self, start: int, end: int) -> bool:
+        # Returns False on the empty line which ends headers section
+        if start == end:
+            # Ignore empty lines before request line (RFC 7230, 3.5)
+            return self.method is None
+
+        if self.method is None:
+            parts = bytes(self._mv[start:end]).decode().split(' ')
+            if len(parts) != 3:
+                raise ValueError('Malformed request line')
+            self.method = parts[0]
+            self.path = parts[1].split('?')[0]
+            self.http11 = parts[2] == 'HTTP/1.1'
+            return True
+
+        colon = start
+        while colon < end and self._buf[colon] != 58:  # ':'
+            colon += 1
+        if colon == end:
+            raise ValueError('Malformed header')
+
+        if self._name_is(start, colon, b'upgrade'):
+            self.upgrade = self._value(colon, end).lower() == b'websocket'
+        elif self._name_is(start, colon, b'connection'):
+            for token in self._value(colon, end).lower().split(b','):
+                token = token.strip()
+                if token == b'close':
+                    self.conn_close = True
+                elif token == b'keep-alive':
+                    self.conn_keep_alive = True
+        elif self._name_is(start, colon, b'sec-websocket-key'):
+            self.ws_key = self._value(colon, end)
+        return True
+
+    def _name_is(self, start: int, end: int, name: bytes) -> bool:
+        # Case insensitive compare of header name in buffer with lowercase name
+        if end - start != len(name):
+            return False
+        buf = self._buf
+        for i in range(len(name)):
+            c = buf[start + i]
+            if 65 <= c <= 90:
+                c += 32
+            if c != name[i]:
+                return False
+        return True
+
+    def _value(self, colon: int, end: int) -> bytes:
+        return bytes(self._mv[colon + 1:end]).strip()
+
+
+class HttpConnection:
+    def __init__(self, addr: str, s: socket):
+        self.address = addr
+        self.socket = s
+        self.request = HttpRequest()
+        self.last_active = ticks_ms()
+        self.request_start = ticks_us()
+
+
+class Histogram:
+    """Latency histogram with fixed bucket upper bounds in microseconds, last bucket counts everything above."""
+
+    BOUNDS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+    def __init__(self, bounds: tuple = BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, us: int):
+        i = 0
+        for bound in self.bounds:
+            if us <= bound:
+                break
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += us
+        if us > self.max:
+            self.max = us
+
+    def lines(self, name: str, help_text: str):
+        yield '# HELP {} {}'.format(name, help_text)
+        yield '# TYPE {} histogram'.format(name)
+        total = 0
+        for bound, n in zip(self.bounds, self.buckets):
+            total += n
+            yield '{}_bucket{{le="{}"}} {}'.format(name, bound, total)
+        yield '{}_bucket{{le="+Inf"}} {}'.format(name, self.count)
+        yield '{}_sum {}'.format(name, self.sum)
+        yield '{}_count {}'.format(name, self.count)
+        # Max isn't part of histogram type, it goes as separate gauge
+        yield '# HELP {}_max Maximum of {}'.format(name, help_text[0].lower() + help_text[1:])
+        yield '# TYPE {}_max gauge'.format(name)
+        yield '{}_max {}'.format(name, self.max)
+
+
+class Metrics:
+    """Counters and latency histograms of WebSocketServer, rendered in Prometheus text format by /metrics.
+
+    Text is generated line by line, so it can be sent without building the whole document in memory."""
+
+    COUNTERS = (
+        ('accepted', 'TCP connections accepted'),
+        ('http_requests', 'HTTP requests parsed'),
+        ('upgrades', 'Connections upgraded to WebSocket'),
+        ('bytes_in', 'HTTP bytes received'),
+        ('bytes_out', 'HTTP bytes sent'),
+        ('ws_messages_in', 'WebSocket messages received'),
+        ('ws_messages_out', 'WebSocket messages sent'),
+        ('ws_bytes_in', 'WebSocket payload bytes received'),
+        ('ws_bytes_out', 'WebSocket payload bytes sent'),
+    )
+
+    def __init__(self):
+        for name, _ in self.COUNTERS:
+            setattr(self, name, 0)
+        self.responses = {}
+        self.handshake = Histogram()
+        self.loop = Histogram()
+        self.client = Histogram()
+        self.slowest_client = None
+        self.slowest_client_us = 0
+
+    def response(self, code: int):
+        self.responses[code] = self.responses.get(code, 0) + 1
+
+    def lines(self):
+        for name, help_text in self.COUNTERS:
+            yield '# HELP uws_{}_total {}'.format(name, help_text)
+            yield '# TYPE uws_{}_total counter'.format(name)
+            yield 'uws_{}_total {}'.format(name, getattr(self, name))
+        yield '# HELP uws_rejected_total Connections rejected with 503'
+        yield '# TYPE uws_rejected_total counter'
+        yield 'uws_rejected_total {}'.format(self.responses.get(503, 0))
+        yield '# HELP uws_responses_total HTTP responses by status code'
+        yield '# TYPE uws_responses_total counter'
+        for code in sorted(self.responses):
+            yield 'uws_responses_total{{code="{}"}} {}'.format(code, self.responses[code])
+        yield from self.handshake.lines('uws_handshake_us', 'Time from first byte of upgrade request to 101 response')
+        yield from self.loop.lines('uws_loop_us', 'Duration of process_all iteration')
+        yield from self.client.lines('uws_client_process_us', 'Duration of client.process() call')
+        yield '# HELP uws_slowest_client_us Longest client.process() call and its client address'
+        yield '# TYPE uws_slowest_client_us gauge'
+        yield 'uws_slowest_client_us{{address="{}"}} {}'.format(self.slowest_client, self.slowest_client_us)
+
+
 class WebSocketServer:
 
-    def __init__(self, max_connections: int = 1):
+    def __init__(self, max_connections: int = 1, max_http_connections: int = 4, keep_alive_timeout: int = 5000,
+                 metrics_path: str = '/metrics'):
         self._listen_s = None
         self._listen_poll = None
+        self._http_poll = None
         self._clients = []
+        self._http_conns = []
         self._max_connections = max_connections
+        self._max_http_connections = max_http_connections
+        self._keep_alive_timeout = keep_alive_timeout
         self._web_dir = 'www'
+        self._file_buf = bytearray(512)
+        self._metrics_path = metrics_path
+        self.metrics = Metrics()
 
     def _make_client(self, conn: WebSocketConnection) -> WebSocketClient:
         return WebSocketClient(conn)
@@ -92,6 +439,7 @@ class WebSocketServer:
         self._listen_s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._listen_s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._listen_poll = uselect.poll()
+        self._http_poll = uselect.poll()
         self._listen_s.bind(socket.getaddrinfo("0.0.0.0", port)[0][4])
         self._listen_s.listen(1)
         self._listen_poll.register(self._listen_s)
@@ -112,31 +460,157 @@ class WebSocketServer:
     def _accept_conn(self):
         cl, remote_addr = self._listen_s.accept()
         print("Client connection from:", remote_addr)
+        self.metrics.accepted += 1
+
+        if len(self._http_conns) >= self._max_http_connections:
+            # Make room by dropping the connection which waits for a request the longest
+            self._close_http_conn(self._http_conns[0])
+
+        # Responses are written in one piece, so Nagle would only hold back their last segment on kept alive connection
+        if hasattr(socket, 'TCP_NODELAY'):
+            try:
+                cl.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+
+        # Request is parsed incrementally in _check_http_connections, as its bytes arrive
+        cl.setblocking(False)
+        self._http_conns.append(HttpConnection(remote_addr, cl))
+        self._http_poll.register(cl, uselect.POLLIN)
+
+    def _check_http_connections(self):
+        for event in self._http_poll.poll(0):
+            conn = self._find_http_conn(event[0])
+            if conn is None:
+                continue
+
+            if event[1] & (uselect.POLLHUP | uselect.POLLERR):
+                self._close_http_conn(conn)
+                continue
+
+            # Read everything the socket has straight into request buffer, until headers are complete
+            request = conn.request
+            new_request = not request.buffered
+            received = 0
+            complete = False
+            closed = False
+            try:
+                while not complete:
+                    n = self._recv_into(conn.socket, request.space())
+                    if n is None:
+                        break
+                    if not n:
+                        # No bytes => connection closed by peer
+                        closed = True
+                        break
+                    received += n
+                    complete = request.received(n)
+            except OSError as e:
+                closed = e.args[0] != EAGAIN
+            except ValueError:
+                self.metrics.bytes_in += received
+                self._reject_http_conn(conn)
+                continue
+
+            self.metrics.bytes_in += received
+            if closed:
+                self._close_http_conn(conn)
+                continue
+            if not received:
+                continue
+
+            conn.last_active = ticks_ms()
+            if new_request:
+                # First bytes of a new request, idle time of kept alive connection isn't part of its latency
+                conn.request_start = ticks_us()
+
+            while complete:
+                complete = self._handle_request(conn)
+
+        now = ticks_ms()
+        for conn in self._http_conns[:]:
+            if ticks_diff(now, conn.last_active) > self._keep_alive_timeout:
+                self._close_http_conn(conn)
+
+    def _handle_request(self, conn: HttpConnection) -> bool:
+        # Returns True if next request is already buffered for the same connection
+        request = conn.request
+        sock = conn.socket
+        self._release_http_conn(conn)
+        sock.setblocking(True)
+        self.metrics.http_requests += 1
+
+        if request.upgrade:
+            self._upgrade_conn(conn)
+            return False
+
+        if request.method != 'GET':
+            self._generate_static_page(sock, 400, '400 Bad Request')
+            return False
+
+        if request.path == self._metrics_path:
+            if not self._serve_metrics(sock, request.keep_alive):
+                return False
+        else:
+            requested_file = "/index.html" if request.path == '/' else request.path
+            if not self._serve_file(requested_file, sock, request.keep_alive):
+                return False
+
+        # Keep connection open for next requests from the same client
+        sock.setblocking(False)
+        conn.last_active = ticks_ms()
+        self._http_conns.append(conn)
+        self._http_poll.register(sock, uselect.POLLIN)
+        conn.request_start = ticks_us()
+        try:
+            return request.next()
+        except ValueError:
+            self._reject_http_conn(conn)
+            return False
 
+    def _upgrade_conn(self, conn: HttpConnection):
+        cl = conn.socket
         if len(self._clients) >= self._max_connections:
             # Maximum connections limit reached
-            cl.setblocking(True)
             self._generate_static_page(cl, 503, '503 Too Many Connections')
             return
 
-        data = cl.recv(64).decode()
-        if data and 'Upgrade: websocket' not in data.split('\r\n') and 'GET' == data.split(' ')[0]:
-            # data should looks like GET /index.html HTTP/1.1\r\nHost: 19'
-            # requested file is on second position in data, ignore all get parameters after question mark
-            requested_file = data.split(' ')[1].split('?')[0]
-            requested_file = "/index.html" if requested_file in [None, '/'] else requested_file
-
-            cl.setblocking(True)
-            self._serve_file(requested_file, cl)
+        if not conn.request.ws_key:
+            self._generate_static_page(cl, 400, '400 Bad Request')
             return
 
         try:
-            websocket_helper.server_handshake(cl)
-            self._clients.append(self._make_client(WebSocketConnection(remote_addr, cl, self.remove_connection)))
+            self._send(cl, self._generate_handshake(conn.request.ws_key))
+            self.metrics.response(101)
+            self.metrics.upgrades += 1
+            self.metrics.handshake.observe(ticks_diff(ticks_us(), conn.request_start))
+            self._clients.append(self._make_client(
+                WebSocketConnection(conn.address, cl, self.remove_connection, self.metrics)))
         except OSError:
             self._generate_static_page(cl, 500, '500 Internal Server Error [2]')
 
-    def _serve_file(self, file: str, sock: socket):
+    def _find_http_conn(self, sock: socket):
+        for conn in self._http_conns:
+            if conn.socket is sock:
+                return conn
+        return None
+
+    def _release_http_conn(self, conn: HttpConnection):
+        self._http_poll.unregister(conn.socket)
+        self._http_conns.remove(conn)
+
+    def _close_http_conn(self, conn: HttpConnection):
+        self._release_http_conn(conn)
+        conn.socket.close()
+
+    def _reject_http_conn(self, conn: HttpConnection):
+        self._release_http_conn(conn)
+        conn.socket.setblocking(True)
+        self._generate_static_page(conn.socket, 400, '400 Bad Request')
+
+    def _serve_file(self, file: str, sock: socket, keep_alive: bool = False) -> bool:
+        # Returns True if connection is still open after response was sent
+        headers_sent = False
         try:
             # check if file exists in web directory
             path = file.split('/')
@@ -144,29 +618,113 @@ class WebSocketServer:
             subdir = '/' + '/'.join(path[1:-1]) if len(path) > 2 else ''
 
             if filename not in os.listdir(self._web_dir + subdir):
-                self._generate_static_page(sock, 404, '404 Not Found')
-                return
+                return self._generate_static_page(sock, 404, '404 Not Found', keep_alive)
 
             file_path = self._web_dir + file
             length = os.stat(file_path)[6]
-            sock.sendall(self._generate_headers(200, file_path, length))
-            # Process page by lines to avoid large strings
-            with open(file_path, 'r') as f:
-                for line in f:
-                    sock.sendall(line)
+            self.metrics.response(200)
+            headers_sent = True
+            # Send file in chunks through preallocated buffer to avoid large strings, first chunk goes in the same
+            # write as headers, so small files take a single segment
+            mv = memoryview(self._file_buf)
+            n = self._buffer_headers(self._generate_headers(200, file_path, length, keep_alive))
+            with open(file_path, 'rb') as f:
+                while True:
+                    n += f.readinto(mv[n:]) or 0
+                    if not n:
+                        break
+                    self._send(sock, mv[:n])
+                    n = 0
+            if keep_alive:
+                return True
+            sleep(0.1)
+            sock.close()
+        except OSError:
+            if headers_sent:
+                # Response already started (or client is gone), error page can't be sent anymore
+                self._close_socket(sock)
+            else:
+                self._generate_static_page(sock, 500, '500 Internal Server Error [2]')
+        return False
+
+    def _serve_metrics(self, sock: socket, keep_alive: bool = False) -> bool:
+        # Text is generated twice, first only to get its length, then line by line into file buffer which is sent
+        # whenever it fills up. Sent bytes are counted at the end, so both passes render the same values
+        metrics = self.metrics
+        try:
+            metrics.response(200)
+            length = 0
+            for line in metrics.lines():
+                length += len(line) + 1
+            n = self._buffer_headers(self._generate_headers(200, 'metrics.txt', length, keep_alive))
+            headers_length = n
+            for line in metrics.lines():
+                n = self._buffer_send(sock, n, line.encode())
+                n = self._buffer_send(sock, n, b'\n')
+            sock.sendall(memoryview(self._file_buf)[:n])
+            metrics.bytes_out += headers_length + length
+            if keep_alive:
+                return True
             sleep(0.1)
             sock.close()
         except OSError:
-            self._generate_static_page(sock, 500, '500 Internal Server Error [2]')
+            # Sending failed, so error page can't be sent either
+            self._close_socket(sock)
+        return False
+
+    def _buffer_headers(self, headers: str) -> int:
+        # Copy headers to the beginning of file buffer, returns their length
+        data = headers.encode()
+        memoryview(self._file_buf)[:len(data)] = data
+        return len(data)
+
+    def _buffer_send(self, sock: socket, n: int, data) -> int:
+        # Append data after n bytes already in file buffer, sending the buffer whenever it is full.
+        # Returns number of bytes left in the buffer
+        mv = memoryview(self._file_buf)
+        data = memoryview(data)
+        i = 0
+        while i < len(data):
+            if n == len(mv):
+                sock.sendall(mv)
+                n = 0
+            chunk = min(len(data) - i, len(mv) - n)
+            mv[n:n + chunk] = data[i:i + chunk]
+            n += chunk
+            i += chunk
+        return n
 
     @staticmethod
-    def _generate_headers(code: int, file_name: str = None, length: int = None) -> str:
+    def _recv_into(sock: socket, buf) -> int:
+        # Returns None if there is nothing to read. MicroPython sockets read with readinto, CPython ones with recv_into
+        if hasattr(sock, 'readinto'):
+            return sock.readinto(buf)
+        return sock.recv_into(buf)
+
+    def _send(self, sock: socket, data):
+        if isinstance(data, str):
+            data = data.encode()
+        sock.sendall(data)
+        self.metrics.bytes_out += len(data)
+
+    @staticmethod
+    def _generate_handshake(key: bytes) -> bytes:
+        d = uhashlib.sha1(key)
+        d.update(WEBSOCKET_GUID)
+        return b'HTTP/1.1 101 Switching Protocols\r\n' \
+               b'Upgrade: websocket\r\n' \
+               b'Connection: Upgrade\r\n' \
+               b'Sec-WebSocket-Accept: ' + ubinascii.b2a_base64(d.digest())[:-1] + b'\r\n\r\n'
+
+    @staticmethod
+    def _generate_headers(code: int, file_name: str = None, length: int = None, keep_alive: bool = False) -> str:
 
         header = ''
         content_type = 'text/html'
 
         http_codes = {
             200: 'OK',
+            400: 'Bad Request',
             404: 'Not Found',
             500: 'Internal Server Error',
             503: 'Service Unavailable'
@@ -180,29 +738,47 @@ class WebSocketServer:
             'html': 'text/html',
             'htm': 'text/html',
             'css': 'text/css',
+            'txt': 'text/plain',
             'js': 'application/javascript'
         }
 
         if code in http_codes:
-            header = 'HTTP/1.1 {} {}\n'.format(code, http_codes[code])
+            header = 'HTTP/1.1 {} {}\r\n'.format(code, http_codes[code])
 
         if file_name is not None:
             ext = file_name.split('.')[1]
             if ext in mime_types:
                 content_type = mime_types[ext]
 
-        header += 'Content-Type: {}\n'.format(content_type)
-        header += 'Content-Length: {}\n'.format(length)
-        header += 'Server: ESPServer\n'
-        header += 'Connection: close\n\n'  # Close connection after completing the request
+        header += 'Content-Type: {}\r\n'.format(content_type)
+        header += 'Content-Length: {}\r\n'.format(length)
+        header += 'Server: ESPServer\r\n'
+        if keep_alive:
+            header += 'Connection: keep-alive\r\n\r\n'
+        else:
+            header += 'Connection: close\r\n\r\n'  # Close connection after completing the request
         return header
 
+    def _generate_static_page(self, sock: socket, code: int, message: str, keep_alive: bool = False) -> bool:
+        body = '<html><body><h1>' + message + '</h1></body></html>'
+        self.metrics.response(code)
+        try:
+            self._send(sock, self._generate_headers(code, None, len(body), keep_alive) + body)
+            if keep_alive:
+                return True
+            sleep(0.1)
+            sock.close()
+        except OSError:
+            # Client closed or reset connection, nothing more to do with it
+            self._close_socket(sock)
+        return False
+
     @staticmethod
-    def _generate_static_page(sock: socket, code: int, message: str):
-        sock.sendall(WebSocketServer._generate_headers(code))
-        sock.sendall('<html><body><h1>' + message + '</h1></body></html>')
-        sleep(0.1)
-        sock.close()
+    def _close_socket(sock: socket):
+        try:
+            sock.close()
+        except OSError:
+            pass
 
     def stop(self):
         if self._listen_poll:
@@ -212,7 +788,11 @@ class WebSocketServer:
             self._listen_s.close()
         self._listen_s = None
 
-        for client in self._clients:
+        for conn in self._http_conns[:]:
+            self._close_http_conn(conn)
+        self._http_poll = None
+
+        for client in self._clients[:]:
             client.connection.close()
         print("Stopped WebSocket server.")
 
@@ -222,15 +802,31 @@ class WebSocketServer:
         self._setup_conn(port)
         print("Started WebSocket server.")
 
-    async def process_all(self):
-        while True:
-            self._check_new_connections(self._accept_conn)
+    def process_once(self):
+        """Run one iteration of server loop, for use from own scheduler instead of process_all."""
+        start = ticks_us()
+        self._check_new_connections(self._accept_conn)
+        self._check_http_connections()
+
+        for client in self._clients:
+            client_start = ticks_us()
+            client.process()
+            self._client_timed(client, ticks_diff(ticks_us(), client_start))
 
-            for client in self._clients:
-                client.process()
+        self.metrics.loop.observe(ticks_diff(ticks_us(), start))
 
+    async def process_all(self):
+        while True:
+            self.process_once()
             await asyncio.sleep_ms(10)
 
+    def _client_timed(self, client: WebSocketClient, us: int):
+        # Called after each client.process() with its duration, override to add own per client statistics
+        self.metrics.client.observe(us)
+        if us > self.metrics.slowest_client_us:
+            self.metrics.slowest_client_us = us
+            self.metrics.slowest_client = client.connection.address
+
     def remove_connection(self, conn):
         for client in self._clients:
             if client.connection is conn: